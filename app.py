@@ -2,14 +2,22 @@
 """
 Flask app for issue tracer: login, search API, and static SPA.
 """
+import errno
+import hashlib
+import hmac
 import json
 import os
-import subprocess
-import sys
+import re
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
+from functools import lru_cache, wraps
 from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from flask import (
     Flask,
@@ -17,12 +25,18 @@ from flask import (
     jsonify,
     redirect,
     request,
-    send_from_directory,
     session,
     stream_with_context,
     url_for,
 )
 
+from graylog_tracer import run_trace
+
+try:
+    import orjson
+except ImportError:  # optional; speeds up JSON on the AI streaming path
+    orjson = None
+
 load_dotenv()
 
 app = Flask(__name__, static_folder="static", static_url_path="")
@@ -31,28 +45,80 @@ app.config["SESSION_COOKIE_HTTPONLY"] = True
 app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
 
 PROJECT_ROOT = Path(__file__).resolve().parent
-TRACER_SCRIPT = PROJECT_ROOT / "graylog_tracer.py"
 AI_RESULTS_DIR = PROJECT_ROOT / "ai-results"
+STATIC_DIR = PROJECT_ROOT / "static"
+# Searches run in-process on worker threads so a hung Graylog query can be timed out
+SEARCH_TIMEOUT_SECONDS = 300
+_SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="trace")
+# AI results are written off the request path by a single background writer
+_AI_RESULT_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ai-result-writer")
 
-# Date/time validation (Asia/Tehran semantics: YYYY-MM-DD, HH:MM or HH:MM:SS)
-DATE_FMT = "%Y-%m-%d"
-TIME_FMTS = ("%H:%M:%S", "%H:%M")
+# Shared session for AI API calls so TCP/TLS connections are kept alive between requests
+_AI_SESSION = requests.Session()
+_AI_SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=0))
+_AI_SESSION.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=0))
 
+if orjson is not None:
+    _json_loads = orjson.loads
 
-def _parse_dt(date_str: str, time_str: str) -> datetime | None:
-    if not (date_str or "").strip() or not (time_str or "").strip():
+    def _sse_event(obj: dict) -> bytes:
+        return b"data: " + orjson.dumps(obj) + b"\n\n"
+else:
+    _json_loads = json.loads
+
+    def _sse_event(obj: dict) -> bytes:
+        return f"data: {json.dumps(obj)}\n\n".encode("utf-8")
+
+
+# Date/time validation (Asia/Tehran semantics: YYYY-MM-DD, HH:MM or HH:MM:SS)
+def _parse_fixed_dt(date_str: str, time_str: str) -> datetime | None:
+    """Parse YYYY-MM-DD and HH:MM[:SS] by slicing; None if either doesn't match or is out of range."""
+    if len(date_str) != 10 or date_str[4] != "-" or date_str[7] != "-":
+        return None
+    n = len(time_str)
+    if n not in (5, 8) or time_str[2] != ":" or (n == 8 and time_str[5] != ":"):
+        return None
+    digits = date_str[0:4] + date_str[5:7] + date_str[8:10] + time_str[0:2] + time_str[3:5] + time_str[6:8]
+    if not (digits.isascii() and digits.isdigit()):
         return None
     try:
-        datetime.strptime((date_str or "").strip(), DATE_FMT)
+        # datetime() raises ValueError for out-of-range month/day/hour/minute/second
+        return datetime(
+            int(date_str[0:4]),
+            int(date_str[5:7]),
+            int(date_str[8:10]),
+            int(time_str[0:2]),
+            int(time_str[3:5]),
+            int(time_str[6:8]) if n == 8 else 0,
+        )
     except ValueError:
         return None
-    combined = f"{(date_str or '').strip()} {(time_str or '').strip()}"
-    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
-        try:
-            return datetime.strptime(combined, fmt)
-        except ValueError:
-            continue
-    return None
+
+
+def _parse_dt(date_str: str, time_str: str) -> datetime | None:
+    date_str = (date_str or "").strip()
+    time_str = (time_str or "").strip()
+    if not date_str or not time_str:
+        return None
+    return _parse_fixed_dt(date_str, time_str)
+
+
+def _load_html_page(name: str) -> tuple[bytes, str]:
+    body = (STATIC_DIR / name).read_bytes()
+    return body, hashlib.sha1(body).hexdigest()
+
+
+# SPA pages are read once at startup and served from memory with an ETag, so revalidations get a 304
+_HTML_PAGES = {name: _load_html_page(name) for name in ("login.html", "app.html", "admin.html")}
+
+
+def _html_page(name: str) -> Response:
+    body, etag = _HTML_PAGES[name]
+    resp = Response(body, mimetype="text/html")
+    resp.set_etag(etag)
+    # no-cache: the browser must revalidate (cheap 304), so the login check in the view always runs
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp.make_conditional(request)
 
 
 def _check_logged_in():
@@ -75,7 +141,7 @@ def login_page():
         if next_url and next_url.startswith("/"):
             return redirect(next_url)
         return redirect(url_for("app_page"))
-    return send_from_directory("static", "login.html")
+    return _html_page("login.html")
 
 
 @app.route("/app")
@@ -83,7 +149,7 @@ def app_page():
     if not _check_logged_in():
         next_url = request.full_path  # e.g. /app?start_date=...
         return redirect(url_for("login_page", next=next_url))
-    return send_from_directory("static", "app.html")
+    return _html_page("app.html")
 
 
 ENV_FILE = PROJECT_ROOT / ".env"
@@ -91,65 +157,186 @@ ENV_FILE = PROJECT_ROOT / ".env"
 MASKED_KEYS = frozenset({"AI_API_KEY", "GRAYLOG_PASSWORD", "USER_PASSWORD"})
 
 
+# KEY=value per line; comment lines (leading #) never match since the key can't start with #
+_ENV_LINE_RE = re.compile(r"^[ \t]*([^#=\s][^=\n]*?)[ \t]*=[ \t]*(.*?)[ \t\r]*$", re.MULTILINE)
+# Parsed .env keyed on (st_mtime_ns, st_size); key is reset to None by _write_env_file
+_ENV_CACHE = {"key": None, "val": {}}
+# .env version last applied to os.environ by _maybe_reload_dotenv
+_DOTENV_STATE = {"key": None}
+# Bumped by _write_env_file so env-derived cached responses are rebuilt even if mtime/size collide
+_ENV_GENERATION = {"value": 0}
+
+
+def _env_file_key() -> tuple[int, int] | None:
+    """Return (st_mtime_ns, st_size) of .env, or None if it can't be stat'ed."""
+    try:
+        st = ENV_FILE.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _env_version() -> tuple[int, tuple[int, int]] | None:
+    """Cache key for values derived from .env: (write generation, file key), or None without a .env."""
+    file_key = _env_file_key()
+    return (_ENV_GENERATION["value"], file_key) if file_key is not None else None
+
+
+def _maybe_reload_dotenv() -> None:
+    """Re-apply .env to os.environ only when the file changed since the last load."""
+    key = _env_file_key()
+    if key is None or _DOTENV_STATE["key"] == key:
+        return
+    load_dotenv(ENV_FILE, override=True)
+    _DOTENV_STATE["key"] = key
+
+
+@app.before_request
+def _refresh_env_from_file():
+    # Each gunicorn worker has its own os.environ; pick up .env saved via another worker before any
+    # handler reads the environment (login credentials, search config, AI settings, defaults)
+    _maybe_reload_dotenv()
+
+
 def _read_env_file() -> dict[str, str]:
-    """Read .env file and return key/value dict. Preserves order via dict (Python 3.7+)."""
+    """Read .env file and return key/value dict. Preserves order via dict (Python 3.7+).
+
+    The parsed dict is cached until the file's mtime or size changes; callers must not mutate it.
+    """
+    key = _env_file_key()
+    if key is None:
+        return {}
+    if _ENV_CACHE["key"] == key:
+        return _ENV_CACHE["val"]
     out = {}
-    if not ENV_FILE.is_file():
-        return out
     raw = ENV_FILE.read_text(encoding="utf-8", errors="replace")
-    for line in raw.splitlines():
-        line = line.strip()
-        if not line or line.startswith("#"):
-            continue
-        if "=" not in line:
-            continue
-        key, _, rest = line.partition("=")
-        key = key.strip()
-        if not key:
-            continue
-        value = rest.strip()
+    for m in _ENV_LINE_RE.finditer(raw):
+        value = m.group(2)
         if len(value) >= 2 and value[0] == value[-1] == '"':
             value = value[1:-1].replace('\\"', '"').replace("\\n", "\n").replace("\\\\", "\\")
-        out[key] = value
+        out[m.group(1)] = value
+    _ENV_CACHE["val"] = out
+    _ENV_CACHE["key"] = key
     return out
 
 
+def _write_fd_synced(fd: int, data: bytes) -> None:
+    """Write all of data to fd with os.write, fsync, and close fd."""
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_bytes_synced(path: Path, data: bytes) -> None:
+    """Truncate path and write data with os.write, then fsync."""
+    _write_fd_synced(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), data)
+
+
+# Values containing any of these are written quoted, with the escape table applied
+_ENV_SPECIAL_CHARS = frozenset('"\n\\# ')
+_ENV_ESCAPE_TABLE = str.maketrans({"\\": "\\\\", '"': '\\"', "\n": "\\n"})
+
+
 def _write_env_file(env: dict[str, str]) -> None:
     """Write key/value dict to .env. Values with special chars are quoted."""
     def escape(v: str) -> str:
         if not v:
             return '""'
-        if any(c in v for c in ('"', "\n", "\\", "#", " ")):
-            return '"' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
-        return v
+        if _ENV_SPECIAL_CHARS.isdisjoint(v):
+            return v
+        return '"' + v.translate(_ENV_ESCAPE_TABLE) + '"'
 
     lines = [f"{k}={escape(v)}" for k, v in env.items()]
-    ENV_FILE.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    data = ("\n".join(lines) + "\n").encode("utf-8")
+    # Unique temp name per save, so concurrent saves never write or rename each other's file
+    fd, tmp = tempfile.mkstemp(dir=ENV_FILE.parent, prefix=".env.")
+    try:
+        _write_fd_synced(fd, data)
+        os.replace(tmp, ENV_FILE)
+    except OSError as e:
+        Path(tmp).unlink(missing_ok=True)
+        if e.errno not in (errno.EBUSY, errno.EXDEV):
+            raise
+        # .env is a single-file bind mount (docker-compose) and can't be renamed over; write in place
+        _write_bytes_synced(ENV_FILE, data)
+    _ENV_CACHE["key"] = None
+    _DOTENV_STATE["key"] = None
+    _ENV_GENERATION["value"] += 1
+
+
+def _env_response_cache(build):
+    """Serve a login-only JSON GET view from a cache of its serialized body, per .env version.
+
+    `build` returns the response dict and only runs when .env changed since the body was cached.
+    """
+    cache = {"key": None, "body": b""}
+
+    @wraps(build)
+    def view():
+        if not _check_logged_in():
+            return jsonify({"error": "Unauthorized"}), 401
+        key = _env_version()
+        if key is not None and cache["key"] == key:
+            return Response(cache["body"], mimetype="application/json")
+        try:
+            body = json.dumps(build()).encode("utf-8")
+        except OSError as e:
+            return jsonify({"ok": False, "error": str(e)}), 500
+        cache["body"] = body
+        cache["key"] = key
+        return Response(body, mimetype="application/json")
+
+    return view
 
 
 @app.route("/admin")
 def admin_page():
     if not _check_logged_in():
         return redirect(url_for("login_page", next="/admin"))
-    return send_from_directory("static", "admin.html")
+    return _html_page("admin.html")
 
 
 @app.route("/api/env", methods=["GET"])
+@_env_response_cache
 def api_env_get():
-    if not _check_logged_in():
-        return jsonify({"error": "Unauthorized"}), 401
-    try:
-        env = _read_env_file()
-        # Return as list in .env file order; mask sensitive keys so value is never sent
-        env_list = []
-        for k, v in env.items():
-            if k in MASKED_KEYS:
-                env_list.append({"key": k, "value": "", "masked": True})
-            else:
-                env_list.append({"key": k, "value": v, "masked": False})
-        return jsonify({"ok": True, "env": env_list})
-    except OSError as e:
-        return jsonify({"ok": False, "error": str(e)}), 500
+    env = _read_env_file()
+    # Return as list in .env file order; mask sensitive keys so value is never sent
+    env_list = []
+    for k, v in env.items():
+        if k in MASKED_KEYS:
+            env_list.append({"key": k, "value": "", "masked": True})
+        else:
+            env_list.append({"key": k, "value": v, "masked": False})
+    return {"ok": True, "env": env_list}
+
+
+def _iter_env_items(env: list | dict):
+    """Yield (key, value) pairs with valid, stripped keys from a list of {key|name, value} items or a dict."""
+    if isinstance(env, dict):
+        items = env.items()
+    else:
+        items = (
+            (item.get("key") if "key" in item else item.get("name"), item.get("value"))
+            for item in env
+            if isinstance(item, dict)
+        )
+    for k, v in items:
+        if not isinstance(k, str):
+            continue
+        key = k.strip()
+        if key and "=" not in key and "\n" not in key:
+            yield key, v
+
+
+def _coerce_env_value(key: str, v, current_env: dict[str, str]) -> str:
+    """Stringify a submitted value; an empty masked value keeps the current one."""
+    if key in MASKED_KEYS and (v is None or (isinstance(v, str) and not v.strip())):
+        return current_env.get(key, "")
+    return str(v) if v is not None else ""
 
 
 @app.route("/api/env", methods=["POST"])
@@ -158,48 +345,27 @@ def api_env_save():
         return jsonify({"error": "Unauthorized"}), 401
     data = request.get_json() or {}
     env = data.get("env")
-    current_env = _read_env_file()
-    normalized = []  # list of (key, value) to preserve order
-    if isinstance(env, list):
-        for item in env:
-            if not isinstance(item, dict):
-                continue
-            k = item.get("key") if "key" in item else item.get("name")
-            v = item.get("value")
-            if not isinstance(k, str) or not k.strip():
-                continue
-            key = k.strip()
-            if "=" in key or "\n" in key:
-                continue
-            if key in MASKED_KEYS and (v is None or (isinstance(v, str) and v.strip() == "")):
-                v = current_env.get(key, "")
-            else:
-                v = str(v) if v is not None else ""
-            normalized.append((key, v))
-    elif isinstance(env, dict):
-        for k, v in env.items():
-            if not isinstance(k, str) or not k.strip():
-                continue
-            key = k.strip()
-            if "=" in key or "\n" in key:
-                continue
-            if key in MASKED_KEYS and (v is None or (isinstance(v, str) and v.strip() == "")):
-                v = current_env.get(key, "")
-            else:
-                v = str(v) if v is not None else ""
-            normalized.append((key, v))
-    else:
+    if not isinstance(env, (list, dict)):
         return jsonify({"ok": False, "error": "Missing or invalid 'env' (object or array)"}), 400
+    current_env = _read_env_file()
+    # list of (key, value) to preserve order
+    normalized = [(k, _coerce_env_value(k, v, current_env)) for k, v in _iter_env_items(env)]
     if not normalized:
         return jsonify({"ok": False, "error": "No valid variables to save"}), 400
     try:
         _write_env_file(dict(normalized))
-        load_dotenv(override=True)
+        _maybe_reload_dotenv()
         return jsonify({"ok": True})
     except OSError as e:
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
+@lru_cache(maxsize=4)
+def _expected_credentials(username: str, password: str) -> tuple[bytes, bytes]:
+    """Return (username bytes, sha256 of password) for the configured login, cached per value."""
+    return username.encode("utf-8"), hashlib.sha256(password.encode("utf-8")).digest()
+
+
 @app.route("/api/login", methods=["POST"])
 def api_login():
     data = request.get_json() or {}
@@ -209,7 +375,11 @@ def api_login():
     expected_pass = (os.getenv("USER_PASSWORD") or "").strip()
     if not expected_user or not expected_pass:
         return jsonify({"ok": False, "error": "Login not configured"}), 500
-    if username == expected_user and password == expected_pass:
+    expected_user_b, expected_pass_hash = _expected_credentials(expected_user, expected_pass)
+    # Constant-time compares; & instead of `and` so both always run
+    user_ok = hmac.compare_digest(username.encode("utf-8"), expected_user_b)
+    pass_ok = hmac.compare_digest(hashlib.sha256(password.encode("utf-8")).digest(), expected_pass_hash)
+    if user_ok & pass_ok:
         session["logged_in"] = True
         return jsonify({"ok": True})
     return jsonify({"ok": False, "error": "Invalid username or password"}), 401
@@ -221,45 +391,44 @@ def api_logout():
     return redirect(url_for("login_page"), code=302)
 
 
-def _parse_words_env(raw: str, default: list[str]) -> list[str]:
-    if not (raw or "").strip():
+DEFAULT_HIGHLIGHT_ERROR_WORDS = ("error", "fail", "unknown", "not", "err", "exception", "eof", "crash", "fatal", "unexpected")
+DEFAULT_HIGHLIGHT_WARNING_WORDS = ("warning",)
+
+
+@lru_cache(maxsize=32)
+def _parse_words_env(raw: str | None, default: tuple[str, ...]) -> tuple[str, ...]:
+    """Parse a word list given as a JSON array or as comma-separated words."""
+    s = (raw or "").strip()
+    if not s:
         return default
+    if s[0] != "[":
+        return tuple(w.strip() for w in s.split(",") if w.strip())
     try:
-        val = json.loads(raw)
+        val = json.loads(s)
         if isinstance(val, list) and all(isinstance(x, str) for x in val):
-            return [x.strip() for x in val if x.strip()]
+            return tuple(x.strip() for x in val if x.strip())
         return default
     except (json.JSONDecodeError, TypeError):
         return default
 
 
 @app.route("/api/defaults")
+@_env_response_cache
 def api_defaults():
-    if not _check_logged_in():
-        return jsonify({"error": "Unauthorized"}), 401
-    load_dotenv()
-    default_error = ["error", "fail", "unknown", "not", "err", "exception", "eof", "crash", "fatal", "unexpected"]
-    default_warning = ["warning"]
-    default_special = []
-    default_success = []
-    return jsonify({
+    return {
         "start_date": (os.getenv("START_DATE") or "").strip(),
         "start_time": (os.getenv("START_TIME") or "00:00").strip(),
         "end_date": (os.getenv("END_DATE") or "").strip(),
         "end_time": (os.getenv("END_TIME") or "23:59").strip(),
         "highlight_error_words": _parse_words_env(
-            os.getenv("HIGHLIGHT_ERROR_WORDS"), default_error
+            os.getenv("HIGHLIGHT_ERROR_WORDS"), DEFAULT_HIGHLIGHT_ERROR_WORDS
         ),
         "highlight_warning_words": _parse_words_env(
-            os.getenv("HIGHLIGHT_WARNING_WORDS"), default_warning
+            os.getenv("HIGHLIGHT_WARNING_WORDS"), DEFAULT_HIGHLIGHT_WARNING_WORDS
         ),
-        "highlight_special_words": _parse_words_env(
-            os.getenv("HIGHLIGHT_SPECIAL_WORDS"), default_special
-        ),
-        "highlight_success_words": _parse_words_env(
-            os.getenv("HIGHLIGHT_SUCCESS_WORDS"), default_success
-        ),
-    })
+        "highlight_special_words": _parse_words_env(os.getenv("HIGHLIGHT_SPECIAL_WORDS"), ()),
+        "highlight_success_words": _parse_words_env(os.getenv("HIGHLIGHT_SUCCESS_WORDS"), ()),
+    }
 
 
 @app.route("/api/search", methods=["POST"])
@@ -284,41 +453,45 @@ def api_search():
     from_arg = f"{start_date} {start_time}"
     to_arg = f"{end_date} {end_time}"
 
+    future = _SEARCH_EXECUTOR.submit(run_trace, from_arg, to_arg)
     try:
-        result = subprocess.run(
-            [sys.executable, str(TRACER_SCRIPT), "--from", from_arg, "--to", to_arg],
-            cwd=str(PROJECT_ROOT),
-            capture_output=True,
-            text=True,
-            timeout=300,
-            env={**os.environ},
-        )
-    except subprocess.TimeoutExpired:
+        out = future.result(timeout=SEARCH_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        # Drop it if still queued behind other searches; a running search can't be interrupted
+        future.cancel()
         return jsonify({"ok": False, "error": "Search timed out."}), 504
+    except SystemExit as e:
+        # run_trace reports config/interval errors via SystemExit, like the CLI
+        return jsonify({"ok": False, "error": str(e)}), 500
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
 
-    if result.returncode != 0:
-        err = (result.stderr or result.stdout or "").strip() or f"Exit code {result.returncode}"
-        return jsonify({"ok": False, "error": err}), 500
+    return jsonify({"ok": True, "data": out})
 
-    try:
-        out = json.loads(result.stdout)
-    except json.JSONDecodeError as e:
-        return jsonify({"ok": False, "error": f"Invalid tracer output: {e}"}), 500
 
-    return jsonify({"ok": True, "data": out})
+_AI_RESULT_KEY_RE = re.compile(r"[A-Za-z0-9_-]{1,256}")
 
 
 def _safe_ai_result_key(key: str) -> str | None:
     """Allow only base64url-style filenames (A-Za-z0-9_-)."""
-    if not key or len(key) > 256:
-        return None
-    if all(c.isalnum() or c in "-_" for c in key):
+    if key and _AI_RESULT_KEY_RE.fullmatch(key):
         return key
     return None
 
 
+def _write_ai_result(key: str, text: str) -> None:
+    try:
+        AI_RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        (AI_RESULTS_DIR / f"{key}.txt").write_text(text, encoding="utf-8")
+    except OSError:
+        pass
+
+
+def _save_ai_result(key: str, text: str) -> None:
+    """Queue an AI result for writing to ai-results/<key>.txt; returns without waiting for disk."""
+    _AI_RESULT_WRITER.submit(_write_ai_result, key, text)
+
+
 @app.route("/api/ai-result")
 def api_ai_result_get():
     if not _check_logged_in():
@@ -336,16 +509,42 @@ def api_ai_result_get():
     return jsonify({"ok": True, "content": content})
 
 
-@app.route("/api/ask-ai", methods=["POST"])
-def api_ask_ai():
-    if not _check_logged_in():
-        return jsonify({"error": "Unauthorized"}), 401
-    load_dotenv()
+AIConfig = namedtuple("AIConfig", "model system_prompt url headers")
+# AIConfig built from the environment, keyed on the .env version it was read from
+_AI_CONFIG_CACHE = {"key": None, "val": None}
+
+
+def _get_ai_config() -> AIConfig | None:
+    """Return the AI API settings, rebuilt only when .env changes; None if host/key/model are missing."""
+    key = _env_version()
+    if key is not None and _AI_CONFIG_CACHE["key"] == key:
+        return _AI_CONFIG_CACHE["val"]
     host = (os.getenv("AI_HOST") or "").rstrip("/")
     api_key = (os.getenv("AI_API_KEY") or "").strip()
     model = (os.getenv("AI_MODEL") or "").strip()
     system_prompt = (os.getenv("AI_SYSTEM_PROMPT") or "").strip()
-    if not host or not api_key or not model:
+    cfg = None
+    if host and api_key and model:
+        cfg = AIConfig(
+            model=model,
+            system_prompt=system_prompt or "Analyze this error and provide RCA.",
+            url=f"{host}/chat/completions",
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            },
+        )
+    _AI_CONFIG_CACHE["val"] = cfg
+    _AI_CONFIG_CACHE["key"] = key
+    return cfg
+
+
+@app.route("/api/ask-ai", methods=["POST"])
+def api_ask_ai():
+    if not _check_logged_in():
+        return jsonify({"error": "Unauthorized"}), 401
+    cfg = _get_ai_config()
+    if cfg is None:
         return jsonify({"ok": False, "error": "AI_HOST, AI_API_KEY, and AI_MODEL must be set in .env"}), 500
 
     data = request.get_json() or {}
@@ -354,20 +553,15 @@ def api_ask_ai():
     if not content:
         return jsonify({"ok": False, "error": "Missing content"}), 400
 
-    url = f"{host}/chat/completions"
     payload = {
-        "model": model,
+        "model": cfg.model,
         "messages": [
-            {"role": "system", "content": system_prompt or "Analyze this error and provide RCA."},
+            {"role": "system", "content": cfg.system_prompt},
             {"role": "user", "content": content},
         ],
     }
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
     try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=120)
+        resp = _AI_SESSION.post(cfg.url, json=payload, headers=cfg.headers, timeout=120)
     except requests.RequestException as e:
         return jsonify({"ok": False, "error": str(e)}), 502
 
@@ -386,26 +580,35 @@ def api_ask_ai():
     text = (message.get("content") or "").strip()
 
     if save_key and text:
-        AI_RESULTS_DIR.mkdir(parents=True, exist_ok=True)
-        out_path = AI_RESULTS_DIR / f"{save_key}.txt"
-        try:
-            out_path.write_text(text, encoding="utf-8")
-        except OSError:
-            pass
+        _save_ai_result(save_key, text)
 
     return jsonify({"ok": True, "content": text})
 
 
+def _iter_sse_data(resp: requests.Response):
+    """Yield the raw payload bytes of each 'data: ' line of an SSE response, skipping [DONE].
+
+    Lines are split on bytes; only the JSON payload is ever decoded, by the caller.
+    """
+    buf = bytearray()
+    for chunk in resp.iter_content(chunk_size=8192):
+        buf += chunk
+        while (idx := buf.find(b"\n")) != -1:
+            line = bytes(buf[:idx]).strip()
+            del buf[: idx + 1]
+            if line.startswith(b"data: ") and line != b"data: [DONE]":
+                yield line[6:]
+    line = bytes(buf).strip()
+    if line.startswith(b"data: ") and line != b"data: [DONE]":
+        yield line[6:]
+
+
 @app.route("/api/ask-ai-stream", methods=["POST"])
 def api_ask_ai_stream():
     if not _check_logged_in():
         return jsonify({"error": "Unauthorized"}), 401
-    load_dotenv()
-    host = (os.getenv("AI_HOST") or "").rstrip("/")
-    api_key = (os.getenv("AI_API_KEY") or "").strip()
-    model = (os.getenv("AI_MODEL") or "").strip()
-    system_prompt = (os.getenv("AI_SYSTEM_PROMPT") or "").strip()
-    if not host or not api_key or not model:
+    cfg = _get_ai_config()
+    if cfg is None:
         return jsonify({"ok": False, "error": "AI_HOST, AI_API_KEY, and AI_MODEL must be set in .env"}), 500
 
     data = request.get_json() or {}
@@ -414,68 +617,54 @@ def api_ask_ai_stream():
     if not content:
         return jsonify({"ok": False, "error": "Missing content"}), 400
 
-    url = f"{host}/chat/completions"
     payload = {
-        "model": model,
+        "model": cfg.model,
         "stream": True,
         "messages": [
-            {"role": "system", "content": system_prompt or "Analyze this error and provide RCA."},
+            {"role": "system", "content": cfg.system_prompt},
             {"role": "user", "content": content},
         ],
     }
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
 
     def generate():
         try:
-            resp = requests.post(url, json=payload, headers=headers, timeout=120, stream=True)
+            resp = _AI_SESSION.post(cfg.url, json=payload, headers=cfg.headers, timeout=120, stream=True)
         except requests.RequestException as e:
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            yield _sse_event({"error": str(e)})
             return
-        if resp.status_code != 200:
-            err_msg = resp.text[:500] if resp.text else f"HTTP {resp.status_code}"
-            try:
-                err_body = resp.json()
-                err_msg = err_body.get("error", {}).get("message", err_msg) if isinstance(err_body.get("error"), dict) else err_body.get("error", err_msg)
-            except Exception:
-                pass
-            yield f"data: {json.dumps({'error': err_msg})}\n\n"
-            return
-        full_text = []
-        for line in resp.iter_lines():
-            if line is None:
-                break
-            try:
-                line_str = line.decode("utf-8", errors="replace").strip()
-            except Exception:
-                continue
-            if not line_str or line_str == "data: [DONE]":
-                continue
-            if line_str.startswith("data: "):
+        # Closing releases the pooled connection even if the client disconnects mid-stream
+        with resp:
+            if resp.status_code != 200:
+                err_msg = resp.text[:500] if resp.text else f"HTTP {resp.status_code}"
                 try:
-                    chunk_data = json.loads(line_str[6:])
+                    err_body = resp.json()
+                    err_msg = err_body.get("error", {}).get("message", err_msg) if isinstance(err_body.get("error"), dict) else err_body.get("error", err_msg)
+                except Exception:
+                    pass
+                yield _sse_event({"error": err_msg})
+                return
+            # Only buffer the streamed text when it has to be saved afterwards
+            save_buf = [] if save_key else None
+            for data_bytes in _iter_sse_data(resp):
+                try:
+                    chunk_data = _json_loads(data_bytes)
                     choices = chunk_data.get("choices") or []
                     if not choices:
                         continue
                     delta = choices[0].get("delta") or {}
                     part = delta.get("content")
                     if part:
-                        full_text.append(part)
-                        yield f"data: {json.dumps({'content': part})}\n\n"
-                except (json.JSONDecodeError, KeyError, IndexError):
-                    pass
-        if save_key and full_text:
-            full_str = "".join(full_text).strip()
-            if full_str:
-                AI_RESULTS_DIR.mkdir(parents=True, exist_ok=True)
-                out_path = AI_RESULTS_DIR / f"{save_key}.txt"
-                try:
-                    out_path.write_text(full_str, encoding="utf-8")
-                except OSError:
+                        if save_buf is not None:
+                            save_buf.append(part)
+                        yield _sse_event({"content": part})
+                except (ValueError, KeyError, IndexError):
+                    # ValueError covers JSONDecodeError and undecodable UTF-8
                     pass
-        yield f"data: {json.dumps({'done': True})}\n\n"
+            if save_buf:
+                full_str = "".join(save_buf).strip()
+                if full_str:
+                    _save_ai_result(save_key, full_str)
+            yield _sse_event({"done": True})
 
     return Response(
         stream_with_context(generate()),
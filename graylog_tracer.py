@@ -4,22 +4,78 @@ Graylog issue tracer: search error logs in a date/time interval and output JSON
 with timestamps in Asia/Tehran and all message fields.
 """
 import argparse
+import csv
+import io
 import json
+import math
 import os
+import re
 import sys
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from operator import itemgetter
+from typing import Callable
 from zoneinfo import ZoneInfo
 
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+try:
+    import orjson
+except ImportError:  # optional; faster parsing of Graylog responses and encoding of the output
+    orjson = None
+
+try:
+    import ahocorasick
+except ImportError:  # optional; filter keywords fall back to a regex alternation
+    ahocorasick = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+# ZoneInfo only where DST history matters (parsing wall-clock input, formatting pre-2022 instants)
 TEHRAN = ZoneInfo("Asia/Tehran")
-UTC = ZoneInfo("UTC")
+UTC = timezone.utc
+# Iran has observed no DST since September 2022, so from then on Tehran is a fixed UTC+03:30
+TEHRAN_OFFSET_SECONDS = 3 * 3600 + 30 * 60
+TEHRAN_FIXED = timezone(timedelta(seconds=TEHRAN_OFFSET_SECONDS), name="Asia/Tehran")
+TEHRAN_FIXED_OFFSET_SINCE = datetime(2022, 9, 22, tzinfo=timezone.utc).timestamp()
 
 # Graylog API endpoints (scripting API is newer; universal/absolute is legacy)
 SEARCH_MESSAGES_URL = "/api/search/messages"
 SEARCH_UNIVERSAL_ABSOLUTE_URL = "/api/search/universal/absolute"
+# Streaming CSV export: whole result in one response, no offset paging (needs an explicit field list)
+MESSAGES_EXPORT_URL = "/api/views/search/messages"
+# Export responses meaning "not supported here"; search_graylog then falls back to paged search
+EXPORT_FALLBACK_STATUSES = frozenset({400, 404, 405, 406, 415})
 PAGE_SIZE = 500
+# Upper bound on queries fetched from Graylog concurrently
+MAX_SEARCH_WORKERS = 32
+
+
+def _make_session() -> requests.Session:
+    """Session shared by all searches: pooled keep-alive connections and retries on gateway errors."""
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        read=False,  # a read timeout means Graylog is still running the search: raise it, never resend
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "POST"}),  # both search calls are read-only
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept": "application/json", "X-Requested-By": "issue-tracer"})
+    return session
+
+
+_SESSION = _make_session()
+
 # Fields to request when API requires them; empty means "all" for some Graylog versions
 DEFAULT_FIELDS = [
     "timestamp",
@@ -59,18 +115,19 @@ def _parse_queries_env(raw: str, env_key: str) -> list[str]:
     return queries
 
 
+_TF_RE = re.compile(r"^\s*(\d+)\s*([smh]?)\s*$")
+_TF_UNIT_SECONDS = {"": 1, "s": 1, "m": 60, "h": 3600}
+
+
 def _parse_time_frame_seconds(s: str) -> int:
     """Parse GRAYLOG_QUERIES_FRONTEND_NEXTJS_PODS_TIME_FRAME e.g. '4s', '1m', '2h' -> seconds."""
     s = (s or "").strip().lower()
     if not s:
         return 0
-    if s.endswith("s"):
-        return int(s[:-1].strip() or 0)
-    if s.endswith("m"):
-        return int((s[:-1].strip() or 0)) * 60
-    if s.endswith("h"):
-        return int((s[:-1].strip() or 0)) * 3600
-    return int(s)
+    m = _TF_RE.match(s)
+    if m is None:
+        raise SystemExit(f"Invalid GRAYLOG_QUERIES_FRONTEND_NEXTJS_PODS_TIME_FRAME in .env: {s!r} (e.g. 10s, 1m, 2h)")
+    return int(m.group(1)) * _TF_UNIT_SECONDS[m.group(2)]
 
 
 def load_config():
@@ -117,6 +174,7 @@ def load_config():
         "end_time": end_time,
         "output_fields": output_fields_set,
         "filter_keywords": filter_keywords_lower,
+        "filter_matcher": build_keyword_matcher(filter_keywords_lower),
         "frontend_nextjs_pods_time_frame_seconds": pods_time_frame_seconds,
     }
 
@@ -168,12 +226,69 @@ def parse_interval_from_env(config: dict) -> tuple[datetime, datetime]:
 
 
 def to_tehran_iso(dt: datetime) -> str:
-    return dt.astimezone(TEHRAN).strftime("%Y-%m-%dT%H:%M:%S.%f%z")
+    tz = TEHRAN_FIXED if dt.timestamp() >= TEHRAN_FIXED_OFFSET_SINCE else TEHRAN
+    return dt.astimezone(tz).strftime("%Y-%m-%dT%H:%M:%S.%f%z")
+
+
+@lru_cache(maxsize=8192)
+def _tehran_minute_prefix(utc_minute: int) -> str:
+    """'YYYY-MM-DD HH:MM' in Tehran (fixed +03:30) for a UTC epoch minute."""
+    t = time.gmtime(utc_minute * 60 + TEHRAN_OFFSET_SECONDS)
+    return f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d} {t.tm_hour:02d}:{t.tm_min:02d}"
+
+
+def format_timestamp_tehran_fast(utc_epoch: float) -> str:
+    """Format a UTC epoch as 2026-02-18 19:46:13 +0330/Tehran without building a datetime."""
+    if utc_epoch < TEHRAN_FIXED_OFFSET_SINCE:
+        return format_timestamp_tehran(datetime.fromtimestamp(utc_epoch, tz=UTC))
+    # Messages cluster within a few minutes, so the cached minute prefix is nearly always a hit
+    utc_minute, second = divmod(math.floor(utc_epoch), 60)
+    return f"{_tehran_minute_prefix(utc_minute)}:{second:02d} +0330/Tehran"
 
 
 def format_timestamp_tehran(dt: datetime) -> str:
     """Format as 2026-02-18 19:46:13 +0330/Tehran"""
-    return dt.astimezone(TEHRAN).strftime("%Y-%m-%d %H:%M:%S +0330/Tehran")
+    ts = dt.timestamp()
+    if ts < TEHRAN_FIXED_OFFSET_SINCE:
+        return dt.astimezone(TEHRAN).strftime("%Y-%m-%d %H:%M:%S +0330/Tehran")
+    return format_timestamp_tehran_fast(ts)
+
+
+class GraylogAPIError(RuntimeError):
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"Graylog API error {status_code}: {text[:500]}")
+        self.status_code = status_code
+
+
+def _search_graylog_export(
+    base_url: str, auth: tuple, query: str, from_utc: datetime, to_utc: datetime, fields: list
+) -> tuple[list[str], list[list]]:
+    """Use POST /api/views/search/messages (streaming CSV export). Returns (schema_fields, rows).
+
+    Graylog streams the whole result for one request, so there is no from/offset paging that makes
+    the server re-run the search and skip earlier pages. CSV cells are strings; empty cells become None.
+    """
+    url = f"{base_url.rstrip('/')}{MESSAGES_EXPORT_URL}"
+    payload = {
+        "query_string": {"type": "elasticsearch", "query_string": query},
+        "timerange": {
+            "type": "absolute",
+            "from": from_utc.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "to": to_utc.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        },
+        "fields_in_order": fields,
+        "sort": [{"field": "timestamp", "order": "DESC"}],
+    }
+    with _SESSION.post(
+        url, json=payload, auth=auth, headers={"Accept": "text/csv"}, timeout=60, stream=True
+    ) as resp:
+        if resp.status_code != 200:
+            raise GraylogAPIError(resp.status_code, resp.text)
+        resp.raw.decode_content = True
+        reader = csv.reader(io.TextIOWrapper(resp.raw, encoding="utf-8", newline=""))
+        schema_fields = next(reader, [])
+        rows = [[cell if cell != "" else None for cell in row] for row in reader]
+    return schema_fields, rows
 
 
 def _search_graylog_scripting(
@@ -201,20 +316,10 @@ def _search_graylog_scripting(
 
     while True:
         payload["from"] = offset
-        resp = requests.post(
-            url,
-            json=payload,
-            auth=auth,
-            headers={
-                "Accept": "application/json",
-                "Content-Type": "application/json",
-                "X-Requested-By": "issue-tracer",
-            },
-            timeout=60,
-        )
+        resp = _SESSION.post(url, json=payload, auth=auth, timeout=60)
         if resp.status_code != 200:
-            raise RuntimeError(f"Graylog API error {resp.status_code}: {resp.text[:500]}")
-        data = resp.json()
+            raise GraylogAPIError(resp.status_code, resp.text)
+        data = _json_loads(resp.content)
         schema = data.get("schema", [])
         datarows = data.get("datarows", [])
         if not schema_fields and schema:
@@ -249,16 +354,10 @@ def _search_graylog_legacy(
 
     while True:
         params["offset"] = offset
-        resp = requests.get(
-            url,
-            params=params,
-            auth=auth,
-            headers={"Accept": "application/json", "X-Requested-By": "issue-tracer"},
-            timeout=60,
-        )
+        resp = _SESSION.get(url, params=params, auth=auth, timeout=60)
         if resp.status_code != 200:
-            raise RuntimeError(f"Graylog API error {resp.status_code}: {resp.text[:500]}")
-        data = resp.json()
+            raise GraylogAPIError(resp.status_code, resp.text)
+        data = _json_loads(resp.content)
         messages = data.get("messages", [])
         for m in messages:
             msg_obj = m.get("message", m)
@@ -277,24 +376,39 @@ def _search_graylog_legacy(
 
 
 def search_graylog(base_url: str, auth: tuple, query: str, from_utc: datetime, to_utc: datetime, fields: list | None):
-    """Try Scripting API first; on 404 fall back to legacy universal/absolute."""
+    """Try the streaming export first (when fields are given), then the paged Scripting API, and on 404
+    fall back to legacy universal/absolute."""
+    if fields:
+        try:
+            return _search_graylog_export(base_url, auth, query, from_utc, to_utc, fields)
+        except GraylogAPIError as e:
+            if e.status_code not in EXPORT_FALLBACK_STATUSES:
+                raise
     try:
         return _search_graylog_scripting(base_url, auth, query, from_utc, to_utc, fields)
-    except RuntimeError as e:
-        if "404" not in str(e):
+    except GraylogAPIError as e:
+        if e.status_code != 404:
             raise
     return _search_graylog_legacy(base_url, auth, query, from_utc, to_utc, fields)
 
 
+@lru_cache(maxsize=65536)
+def _parse_iso_timestamp(val: str) -> datetime | None:
+    """ISO-8601 string to aware datetime, or None. Cached: bursts of messages share timestamp strings."""
+    try:
+        return datetime.fromisoformat(val.replace("Z", "+00:00"))
+    except Exception:
+        return None
+
+
 def parse_timestamp_to_utc(val) -> datetime | None:
     """Convert Graylog timestamp (string or number) to UTC datetime."""
     if val is None:
         return None
     if isinstance(val, str):
-        try:
-            return datetime.fromisoformat(val.replace("Z", "+00:00"))
-        except Exception:
-            pass
+        dt = _parse_iso_timestamp(val)
+        if dt is not None:
+            return dt
     try:
         # Unix seconds or milliseconds
         ts = float(val)
@@ -306,137 +420,176 @@ def parse_timestamp_to_utc(val) -> datetime | None:
     return None
 
 
-def row_to_message(
+def row_to_messages_bulk(
     schema_fields: list,
-    row: list,
+    rows: list[list],
     query: str,
-    query_index: int,
     section: str,
     output_fields: frozenset,
-) -> dict:
-    # Build field values; convert timestamp to Tehran format
-    timestamp_tehran = None
-    rest = {}
-    for i, field_name in enumerate(schema_fields):
-        if i >= len(row) or field_name not in output_fields:
-            continue
-        val = row[i]
-        if field_name == "timestamp" and val is not None:
-            dt = parse_timestamp_to_utc(val)
-            if dt is not None:
-                timestamp_tehran = format_timestamp_tehran(dt)
-        else:
-            rest[field_name] = val
-    # Order: timestamp first, then _section, _query, then other fields
-    msg = {}
-    if timestamp_tehran is not None:
-        msg["timestamp"] = timestamp_tehran
-    msg["_section"] = section
-    msg["_query"] = query
-    for k, v in rest.items():
-        msg[k] = v
-    return msg
-
-
-def message_contains_filter_keyword(msg: dict, keywords_lower: list[str]) -> bool:
-    """True if any value in msg contains any keyword (case-insensitive). Exclude such messages."""
+) -> list[dict]:
+    """Build one message dict per row, keeping only output_fields; timestamp is converted to Tehran format.
+
+    The schema is resolved to column indices once per query rather than once per row.
+    """
+    kept = [(i, name) for i, name in enumerate(schema_fields) if name in output_fields and name != "timestamp"]
+    ts_idx = schema_fields.index("timestamp") if "timestamp" in output_fields and "timestamp" in schema_fields else -1
+    if not kept and ts_idx < 0:
+        # No output field present (e.g. GRAYLOG_OUTPUT_FIELDS=[]): every message is just its section and query
+        return [{"_section": section, "_query": query} for _ in rows]
+    messages = []
+    for row in rows:
+        n = len(row)
+        # Order: timestamp first, then _section, _query, then other fields
+        msg = {}
+        if 0 <= ts_idx < n:
+            val = row[ts_idx]
+            if val is None:
+                msg["timestamp"] = None
+            else:
+                dt = parse_timestamp_to_utc(val)
+                if dt is not None:
+                    msg["timestamp"] = format_timestamp_tehran_fast(dt.timestamp())
+        msg["_section"] = section
+        msg["_query"] = query
+        for i, name in kept:
+            if i < n:
+                msg[name] = row[i]
+        messages.append(msg)
+    return messages
+
+
+def build_keyword_matcher(keywords_lower: list[str]) -> Callable[[str], bool] | None:
+    """Return a function telling whether a lowercased string contains any keyword; None if no keywords.
+
+    Uses one Aho-Corasick automaton when pyahocorasick is installed, else one compiled regex alternation,
+    so each text is scanned once for all keywords.
+    """
     if not keywords_lower:
-        return False
-    for key, val in msg.items():
-        if key.startswith("_"):
-            continue
-        if val is None:
-            continue
-        s = str(val).lower()
+        return None
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
         for kw in keywords_lower:
-            if kw in s:
-                return True
-    return False
+            automaton.add_word(kw, kw)
+        automaton.make_automaton()
+        return lambda text: next(automaton.iter(text), None) is not None
+    pattern = re.compile("|".join(re.escape(kw) for kw in keywords_lower))
+    return lambda text: pattern.search(text) is not None
 
 
-def _parse_display_timestamp_tehran(s: str) -> datetime | None:
-    """Parse our displayed timestamp '2026-02-18 19:46:12 +0330/Tehran' to datetime in Tehran."""
-    if not s or not isinstance(s, str):
-        return None
-    s = s.strip()
-    try:
-        # Format: 2026-02-18 19:46:12 +0330/Tehran
-        dt = datetime.strptime(s.replace(" +0330/Tehran", "").strip(), "%Y-%m-%d %H:%M:%S")
-        return dt.replace(tzinfo=TEHRAN)
-    except ValueError:
-        pass
-    return None
+def row_contains_filter_keyword(row: list, scan_indices: list[int], matcher: Callable[[str], bool]) -> bool:
+    """True if any raw cell at scan_indices contains any keyword (case-insensitive). Exclude such rows.
+
+    Runs on the raw Graylog row, before row_to_message, so excluded rows never become message dicts.
+    """
+    n = len(row)
+    # NUL separator so a keyword can't match across two field values
+    blob = "\x00".join(str(row[i]) for i in scan_indices if i < n and row[i] is not None)
+    return matcher(blob.lower())
 
 
-def aggregate_messages_by_time_frame(
-    messages: list[dict], frame_seconds: int, section: str, query: str
+def aggregate_rows_by_time_frame(
+    schema_fields: list,
+    rows: list[list],
+    frame_seconds: int,
+    section: str,
+    query: str,
+    output_fields: frozenset,
 ) -> list[dict]:
-    """Group messages by time buckets of frame_seconds; output one message per bucket with 'message' = all message values joined by newline."""
-    if frame_seconds <= 0 or not messages:
-        return messages
-    buckets: dict[int, list[dict]] = {}
-    for m in messages:
-        ts_str = m.get("timestamp")
-        dt = _parse_display_timestamp_tehran(ts_str) if ts_str else None
+    """Group raw rows into time buckets of frame_seconds; output one message per bucket with 'message' = all message values joined by newline.
+
+    Works on the rows directly, so no per-row message dict is built for aggregated sections. Buckets are
+    filled in one chronological pass; rows are only sorted if Graylog's newest-first order doesn't hold.
+    """
+    if "timestamp" not in output_fields or "timestamp" not in schema_fields:
+        return []
+    ts_idx = schema_fields.index("timestamp")
+    msg_idx = schema_fields.index("message") if "message" in output_fields and "message" in schema_fields else -1
+    # Graylog returns rows newest first, so walking them in reverse is normally already chronological
+    entries: list[tuple[float, object]] = []
+    in_order = True
+    prev_ts = -math.inf
+    for row in reversed(rows):
+        n = len(row)
+        if ts_idx >= n or row[ts_idx] is None:
+            continue
+        dt = parse_timestamp_to_utc(row[ts_idx])
         if dt is None:
             continue
-        utc_ts = dt.astimezone(UTC).timestamp()
-        bucket_id = int(utc_ts // frame_seconds) * frame_seconds
-        buckets.setdefault(bucket_id, []).append(m)
+        utc_ts = dt.timestamp()
+        if utc_ts < prev_ts:
+            in_order = False
+        prev_ts = utc_ts
+        entries.append((utc_ts, row[msg_idx] if 0 <= msg_idx < n else None))
+    if not in_order:
+        entries.sort(key=itemgetter(0))
     aggregated = []
-    for bucket_id in sorted(buckets.keys()):
-        bucket_messages = buckets[bucket_id]
-        bucket_messages.sort(key=lambda m: m.get("timestamp") or "")
-        message_lines = []
-        for m in bucket_messages:
-            val = m.get("message")
-            if val is not None:
-                message_lines.append(str(val).strip())
-        bucket_start = datetime.fromtimestamp(bucket_id, tz=UTC).astimezone(TEHRAN)
-        aggregated.append({
-            "timestamp": format_timestamp_tehran(bucket_start),
-            "_section": section,
-            "_query": query,
-            "message": "\n".join(message_lines) if message_lines else "",
-        })
+    bucket_id = None
+    message_lines: list[str] = []
+    for utc_ts, val in entries:
+        entry_bucket = int(utc_ts // frame_seconds) * frame_seconds
+        if entry_bucket != bucket_id:
+            if bucket_id is not None:
+                aggregated.append(_time_frame_message(bucket_id, message_lines, section, query))
+            bucket_id = entry_bucket
+            message_lines = []
+        if val is not None:
+            message_lines.append(str(val).strip())
+    if bucket_id is not None:
+        aggregated.append(_time_frame_message(bucket_id, message_lines, section, query))
     return aggregated
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Search Graylog for error logs in a date/time interval (Asia/Tehran)."
-    )
-    parser.add_argument(
-        "--from",
-        dest="from_",
-        metavar="DATETIME",
-        help="Start of interval (overrides .env). E.g. 2024-02-20 10:00. Asia/Tehran.",
-    )
-    parser.add_argument(
-        "--to",
-        metavar="DATETIME",
-        help="End of interval (overrides .env). E.g. 2024-02-20 18:00. Asia/Tehran.",
-    )
-    parser.add_argument(
-        "--output",
-        "-o",
-        metavar="FILE",
-        help="Write JSON to file (default: stdout).",
-    )
-    parser.add_argument(
-        "--no-fields",
-        action="store_true",
-        help="Omit 'fields' in API request (try to get all message fields).",
-    )
-    args = parser.parse_args()
+def _time_frame_message(bucket_id: int, message_lines: list[str], section: str, query: str) -> dict:
+    return {
+        "timestamp": format_timestamp_tehran_fast(bucket_id),
+        "_section": section,
+        "_query": query,
+        "message": "\n".join(message_lines) if message_lines else "",
+    }
 
+
+def fetch_all_queries(
+    config: dict, from_utc: datetime, to_utc: datetime, fields: list | None
+) -> dict[tuple[str, int], tuple[list[str], list[list]] | Exception]:
+    """Run every (section, query) search concurrently.
+
+    Returns {(section_key, query_index): (schema_fields, rows)}, or the raised exception for failed queries.
+    """
+    jobs = [
+        (section_key, idx, query)
+        for section_key, queries in config["sections"].items()
+        for idx, query in enumerate(queries)
+    ]
+    fetched = {}
+    if not jobs:
+        return fetched
+    with ThreadPoolExecutor(max_workers=min(MAX_SEARCH_WORKERS, len(jobs))) as executor:
+        futures = {
+            executor.submit(
+                search_graylog, config["base_url"], config["auth"], query, from_utc, to_utc, fields
+            ): (section_key, idx)
+            for section_key, idx, query in jobs
+        }
+        for future in as_completed(futures):
+            try:
+                fetched[futures[future]] = future.result()
+            except Exception as e:
+                fetched[futures[future]] = e
+    return fetched
+
+
+def run_trace(from_arg: str | None = None, to_arg: str | None = None, no_fields: bool = False) -> dict:
+    """Run all configured queries over the interval and return the output dict.
+
+    from_arg/to_arg override the .env interval (Asia/Tehran); config errors raise SystemExit.
+    """
     config = load_config()
-    if args.from_ is not None or args.to is not None:
-        if args.from_ is None or args.to is None:
+    if from_arg is not None or to_arg is not None:
+        if from_arg is None or to_arg is None:
             raise SystemExit("Provide both --from and --to, or omit both to use .env interval.")
         try:
-            from_dt = parse_datetime(args.from_, TEHRAN)
-            to_dt = parse_datetime(args.to, TEHRAN)
+            from_dt = parse_datetime(from_arg, TEHRAN)
+            to_dt = parse_datetime(to_arg, TEHRAN)
         except ValueError as e:
             raise SystemExit(e)
     else:
@@ -456,49 +609,51 @@ def main():
         "to_utc": to_utc.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
     }
 
-    fields = None if args.no_fields else DEFAULT_FIELDS
+    fields = None if no_fields else DEFAULT_FIELDS
+    fetched = fetch_all_queries(config, from_utc, to_utc, fields)
     results_by_section = {}
     summary_by_section = {}
 
     for section_key, queries in config["sections"].items():
         if not queries:
-            results_by_section[section_key] = {"queries": [], "results": [], "messages": []}
+            results_by_section[section_key] = {"queries": [], "results": []}
             summary_by_section[section_key] = {"total_messages": 0, "per_query": []}
             continue
-        section_messages = []
+        section_total = 0
         section_results = []
         for idx, query in enumerate(queries):
-            try:
-                schema_fields, rows = search_graylog(
-                    config["base_url"],
-                    config["auth"],
-                    query,
-                    from_utc,
-                    to_utc,
-                    fields,
-                )
-            except Exception as e:
+            result = fetched[(section_key, idx)]
+            if isinstance(result, Exception):
                 section_results.append({
                     "query_index": idx,
                     "query": query,
-                    "error": str(e),
+                    "error": str(result),
                     "messages": [],
                 })
                 continue
-            messages = [
-                row_to_message(schema_fields, row, query, idx, section_key, config["output_fields"])
-                for row in rows
-            ]
-            keywords = config.get("filter_keywords") or []
-            messages = [m for m in messages if not message_contains_filter_keyword(m, keywords)]
+            schema_fields, rows = result
+            matcher = config.get("filter_matcher")
+            if matcher is not None:
+                # Output fields other than timestamp (which is replaced by its Tehran display form) and
+                # internal "_"-prefixed fields such as _id, which keyword filtering has never looked at
+                scan_indices = [
+                    i for i, name in enumerate(schema_fields)
+                    if name in config["output_fields"] and name != "timestamp" and not name.startswith("_")
+                ]
+                if scan_indices:
+                    rows = [row for row in rows if not row_contains_filter_keyword(row, scan_indices, matcher)]
             if section_key == SECTION_FRONTEND_NEXTJS_PODS and config.get("frontend_nextjs_pods_time_frame_seconds", 0) > 0:
-                messages = aggregate_messages_by_time_frame(
-                    messages,
+                messages = aggregate_rows_by_time_frame(
+                    schema_fields,
+                    rows,
                     config["frontend_nextjs_pods_time_frame_seconds"],
                     section_key,
                     query,
+                    config["output_fields"],
                 )
-            section_messages.extend(messages)
+            else:
+                messages = row_to_messages_bulk(schema_fields, rows, query, section_key, config["output_fields"])
+            section_total += len(messages)
             section_results.append({
                 "query_index": idx,
                 "query": query,
@@ -508,10 +663,9 @@ def main():
         results_by_section[section_key] = {
             "queries": queries,
             "results": section_results,
-            "messages": section_messages,
         }
         summary_by_section[section_key] = {
-            "total_messages": len(section_messages),
+            "total_messages": section_total,
             "per_query": [r.get("message_count", 0) for r in section_results],
         }
 
@@ -521,7 +675,6 @@ def main():
             section_key: {
                 "queries": data["queries"],
                 "results": data["results"],
-                "messages": data["messages"],
                 "summary": summary_by_section[section_key],
             }
             for section_key, data in results_by_section.items()
@@ -532,12 +685,74 @@ def main():
         },
     }
 
-    json_str = json.dumps(out, ensure_ascii=False, indent=2)
+    return out
+
+
+def _dumps_indented(obj, level: int = 0) -> bytes:
+    """Pretty JSON (2-space indent) for obj, nested `level` levels deep in an enclosing document."""
+    if orjson is not None:
+        data = orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+    else:
+        data = json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    # Encoded strings never contain a raw newline, so every b"\n" is a line break of the layout
+    return data.replace(b"\n", b"\n" + b"  " * level) if level else data
+
+
+def write_output_json(out: dict, f) -> None:
+    """Write the run_trace output to binary file f as indented JSON, encoding one section at a time.
+
+    Same bytes as dumping the whole dict, without holding the encoded document in memory at once.
+    """
+    f.write(b"{")
+    for i, (key, value) in enumerate(out.items()):
+        f.write((b",\n  " if i else b"\n  ") + _dumps_indented(key) + b": ")
+        if key == "sections" and value:
+            f.write(b"{")
+            for j, (section_key, section) in enumerate(value.items()):
+                f.write((b",\n    " if j else b"\n    ") + _dumps_indented(section_key) + b": ")
+                f.write(_dumps_indented(section, 2))
+            f.write(b"\n  }")
+        else:
+            f.write(_dumps_indented(value, 1))
+    f.write(b"\n}" if out else b"}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Search Graylog for error logs in a date/time interval (Asia/Tehran)."
+    )
+    parser.add_argument(
+        "--from",
+        dest="from_",
+        metavar="DATETIME",
+        help="Start of interval (overrides .env). E.g. 2024-02-20 10:00. Asia/Tehran.",
+    )
+    parser.add_argument(
+        "--to",
+        metavar="DATETIME",
+        help="End of interval (overrides .env). E.g. 2024-02-20 18:00. Asia/Tehran.",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        metavar="FILE",
+        help="Write JSON to file (default: stdout).",
+    )
+    parser.add_argument(
+        "--no-fields",
+        action="store_true",
+        help="Omit 'fields' in API request (try to get all message fields).",
+    )
+    args = parser.parse_args()
+
+    out = run_trace(args.from_, args.to, args.no_fields)
     if args.output:
-        with open(args.output, "w", encoding="utf-8") as f:
-            f.write(json_str)
+        with open(args.output, "wb") as f:
+            write_output_json(out, f)
     else:
-        print(json_str)
+        write_output_json(out, sys.stdout.buffer)
+        sys.stdout.buffer.write(b"\n")
+        sys.stdout.flush()
 
 
 if __name__ == "__main__":